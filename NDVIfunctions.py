@@ -1,327 +1,293 @@
-import io
-import numpy as np
-
-def write_HSD_to_buffer(file_path: str, data: np.ndarray):
-    """
-    Writes hyperspectral data to a binary file.
-
-    Parameters:
-    -----------
-    file_path : str
-        Path to save the output binary file.
-    data : np.ndarray
-        Hyperspectral data in the shape (Y, Z, X). This will be transposed to (Y, X, Z)
-        before saving if needed.
-    """
-    # Transpose data if needed (optional, based on how you read it later)
-    data = data.transpose(0, 2, 1)
-    
-    try:
-        with open(file_path, 'wb') as file:
-            file.write(data.tobytes())
-        print(f"File successfully saved at: {file_path}")
-    
-    except Exception as e:
-        print(f"Error saving file: {e}")
-
-
-
-def read_HSD_from_buffer(buffer: bytes, band: int = 141) -> np.ndarray:
-    """
-    Reads hyperspectral data from a binary buffer and returns the image cube.
-
-    Parameters:
-    -----------
-    buffer : bytes
-        Binary content of the .hsd or .dat file.
-    band : int
-        Number of spectral bands (default = 141).
-
-    Returns:
-    --------
-    np.ndarray
-        Hyperspectral image cube with shape (Y, Z, X) transposed to (Y, X, Z).
-    int
-        Y dimension (height).
-    int
-        X dimension (width).
-    """
-    file_size = len(buffer)  # Get file size
-
-    # Detect camera type based on file size
-    if file_size == 370623040:
-        HSData, header, Y, X = read_HSC180X(buffer)
-    elif file_size == 87630400:
-        HSData, header, Y, X = read_HSC170X_old(buffer)
-    elif file_size == 44315200:
-        HSData, Y, X = read_HSC170X_new(buffer)
-    elif file_size == 585755200:
-        HSData, header, Y, X = read_HSC180X_CL(buffer)
-    elif file_size == 14805000:
-        HSData, Y, X = read_custom(buffer)
-    else:
-        raise ValueError(f"Unsupported file size: {file_size} bytes")
-
-    return HSData.transpose(0, 2, 1), Y, X
-
-
-def read_custom(buffer):
-    """
-    Reads custom hyperspectral data format (uint8) from buffer.
-
-    Parameters:
-    -----------
-    buffer : bytes
-        Binary content containing header and raw hyperspectral data.
-
-    Returns:
-    --------
-    np.ndarray
-        Hyperspectral data with shape (Y, Z, X).
-    int
-        Y dimension.
-    int
-        X dimension.
-    """
-    X = 350
-    Y = 300
-    Z = 141
-    RAW_len = X * Y * Z
-    header = buffer[:len(buffer) - RAW_len]
-    header_size = len(header)
-    print("Header Size:", header_size, "bytes")
-    dat = np.frombuffer(buffer[header_size:], dtype=np.uint8)
-    HSData = np.reshape(dat, (Y, Z, X))
-    return HSData, Y, X
-
-
-def read_HSC180X_CL(buffer):
-    """
-    Reads data from HSC180X_CL format (uint16).
-
-    Parameters:
-    -----------
-    buffer : bytes
-        Binary content containing header and data.
-
-    Returns:
-    --------
-    np.ndarray
-        Hyperspectral data with shape (Y, Z, X).
-    bytes
-        Header.
-    int
-        Y dimension.
-    int
-        X dimension.
-    """
-    X = 1920
-    Y = 1080
-    Z = 141
-    RAW_len = X * Y * Z * 2
-    header = buffer[:len(buffer) - RAW_len]
-    header_size = len(header)
-    print("Header Size:", header_size, "bytes")
-    dat = np.frombuffer(buffer[header_size:], dtype=np.uint16)
-    HSData = np.reshape(dat, (Y, Z, X))
-    return HSData, header, Y, X
-
-
-def read_HSC180X(buffer):
-    """
-    Reads data from HSC180X format (uint16).
-
-    Parameters:
-    -----------
-    buffer : bytes
-        Binary content containing header and data.
-
-    Returns:
-    --------
-    np.ndarray
-        Hyperspectral data with shape (Y, Z, X).
-    bytes
-        Header.
-    int
-        Y dimension.
-    int
-        X dimension.
-    """
-    X = 1280
-    Y = 1024
-    Z = 141
-    RAW_len = X * Y * Z * 2
-    header = buffer[:len(buffer) - RAW_len]
-    header_size = len(header)
-    print("Header Size:", header_size, "bytes")
-    dat = np.frombuffer(buffer[header_size:], dtype=np.uint16)
-    HSData = np.reshape(dat, (Y, Z, X))
-    return HSData, header, Y, X
-
-
-def read_HSC170X_old(buffer):
-    """
-    Reads data from older HSC170X format (uint16, converted to uint8).
-
-    Parameters:
-    -----------
-    buffer : bytes
-        Binary content containing header and data.
-
-    Returns:
-    --------
-    np.ndarray
-        Hyperspectral data with shape (Y, Z, X), converted to uint8.
-    int
-        Y dimension.
-    int
-        X dimension.
-    """
-    X = 640
-    Y = 480
-    Z = 141
-    RAW_len = X * Y * Z * 2
-    header = buffer[:len(buffer) - RAW_len]
-    header_size = len(header)
-    print("Header Size:", header_size, "bytes")
-    dat = np.frombuffer(buffer[header_size:], dtype=np.uint16)
-    dat = dat.astype(np.uint8)
-    HSData = np.reshape(dat, (Y, Z, X))
-    return HSData, Y, X
-
-
-def read_HSC170X_new(buffer):
-    """
-    Reads data from newer HSC170X format (uint8).
-
-    Parameters:
-    -----------
-    buffer : bytes
-        Binary content containing header and data.
-
-    Returns:
-    --------
-    np.ndarray
-        Hyperspectral data with shape (Y, Z, X).
-    int
-        Y dimension.
-    int
-        X dimension.
-    """
-    X = 640
-    Y = 480
-    Z = 141
-    RAW_len = X * Y * Z
-    header = buffer[:len(buffer) - RAW_len]
-    header_size = len(header)
-    print("Header Size:", header_size, "bytes")
-    dat = np.frombuffer(buffer[header_size:], dtype=np.uint8)
-    HSData = np.reshape(dat, (Y, Z, X))
-    return HSData, Y, X
-
-def load_hsd_local(file_obj):
-    """
-    Loads a hyperspectral .hsd or .dat file from a file-like object into a numpy array.
-
-    Parameters:
-    -----------
-    file_obj : file-like object
-        File-like object returned by Streamlit's st.file_uploader.
-
-    Returns:
-    --------
-    np.ndarray
-        Hyperspectral data array with shape (Y, X, Z).
-    int
-        Y dimension (height).
-    int
-        X dimension (width).
-    """
-    buffer = file_obj.read()
-    HSData, Y, X = read_HSD_from_buffer(buffer)  # Ensure this function is defined elsewhere
-    return HSData, Y, X
-
-import matplotlib.pyplot as plt
-import streamlit as st
-
-def display_heatmap(image_band, title="Band"):
-    """
-    Display a single 2D image band as a heatmap in Streamlit using matplotlib.
-
-    Parameters:
-        image_band (numpy.ndarray): 2D array representing a single spectral band.
-        title (str): Title for the heatmap plot. Default is "Band".
-
-    Returns:
-        None
-    """
-    fig, ax = plt.subplots()
-    ax.imshow(image_band, cmap='viridis')
-    ax.set_title(title)
-    ax.axis('off')
-    st.pyplot(fig)
-
-import numpy as np
-
-def calculate_ndvi(hsi_cube, nir_band_idx, red_band_idx):
-    """
-    Calculate the Normalized Difference Vegetation Index (NDVI) from a hyperspectral cube.
-
-    NDVI = (NIR - Red) / (NIR + Red)
-
-    Parameters:
-        hsi_cube (numpy.ndarray): 3D hyperspectral image cube (rows x cols x bands).
-        nir_band_idx (int): Index of the Near-Infrared (NIR) band.
-        red_band_idx (int): Index of the Red band.
-
-    Returns:
-        numpy.ndarray: 2D NDVI image with values ranging from -1 to 1.
-    """
-    nir = hsi_cube[:, :, nir_band_idx].astype(np.float32)
-    red = hsi_cube[:, :, red_band_idx].astype(np.float32)
-    ndvi = (nir - red) / (nir + red + 1e-6)  # avoid division by zero
-    return ndvi
-
-import numpy as np
-
-def get_red_nir_band_indices(
-    wavelengths: np.ndarray,
-    red_target: float = 660.0,
-    nir_target: float = 800.0
-) -> tuple[int, int]:
-    """
-    Returns the indices of the Red and NIR bands based on the nearest wavelengths.
-
-    Parameters:
-    -----------
-    wavelengths : np.ndarray
-        1D array of wavelengths (in nanometers), one per band.
-    red_target : float
-        Target wavelength for the Red band (default is 660 nm).
-    nir_target : float
-        Target wavelength for the NIR band (default is 800 nm).
-
-    Returns:
-    --------
-    red_idx : int
-        Index of the closest band to the red_target.
-    nir_idx : int
-        Index of the closest band to the nir_target.
-    """
-    red_idx = int(np.argmin(np.abs(wavelengths - red_target)))
-    nir_idx = int(np.argmin(np.abs(wavelengths - nir_target)))
-
-    if red_idx >= len(wavelengths) or nir_idx >= len(wavelengths):
-        raise IndexError("Red or NIR index is out of bounds.")
-
-    return red_idx, nir_idx
-
-
-
-def generate_wavelengths(num_bands: int, start_nm: float, step_nm: float) -> np.ndarray:
-    """
-    Generate wavelengths given start, step and number of bands.
-    """
-    return np.array([start_nm + i * step_nm for i in range(num_bands)])
-
-
+import io
+import mmap
+import shutil
+import tempfile
+import numpy as np
+
+def write_HSD_to_buffer(file_path: str, data: np.ndarray):
+    """
+    Writes hyperspectral data to a binary file.
+
+    Parameters:
+    -----------
+    file_path : str
+        Path to save the output binary file.
+    data : np.ndarray
+        Hyperspectral data in the shape (Y, Z, X). Written in (Y, X, Z) order
+        to match how it is read back later.
+    """
+    try:
+        with open(file_path, 'wb') as file:
+            # Write one (X, Z) row at a time with tofile, which writes straight
+            # from the numpy buffer. Peak memory stays at one row (~0.5 MB for
+            # HSC180X_CL) instead of a full transposed bytes copy of the cube.
+            for y in range(data.shape[0]):
+                np.ascontiguousarray(data[y].T).tofile(file)
+        print(f"File successfully saved at: {file_path}")
+
+    except Exception as e:
+        print(f"Error saving file: {e}")
+
+
+
+def read_HSD_from_buffer(buffer: bytes, band: int = 141) -> np.ndarray:
+    """
+    Reads hyperspectral data from a binary buffer and returns the image cube.
+
+    Parameters:
+    -----------
+    buffer : bytes-like
+        Binary content of the .hsd or .dat file (bytes or an mmap'd region).
+    band : int
+        Number of spectral bands (default = 141).
+
+    Returns:
+    --------
+    np.ndarray
+        Hyperspectral image cube viewed band-major with shape (Z, Y, X).
+        The underlying bytes stay in BIL order, so cube[band] is a strided
+        view: Y contiguous rows of X samples, spaced Z*X apart — row-level
+        locality rather than the element-level gather of the old
+        cube[:, :, band] indexing.
+    int
+        Y dimension (height).
+    int
+        X dimension (width).
+    """
+    file_size = len(buffer)  # Get file size
+
+    # Detect camera type based on file size
+    if file_size not in _FORMATS:
+        raise ValueError(f"Unsupported file size: {file_size} bytes")
+
+    return _read(buffer, file_size)
+
+
+# Known camera formats keyed by exact file size: (X, Y, Z, dtype).
+# 16-bit samples are explicitly little-endian ('<u2') so decoding is correct
+# on any host; uint8 is endian-agnostic.
+_FORMATS = {
+    370623040: (1280, 1024, 141, np.dtype('<u2')),  # HSC180X
+    87630400:  (640,  480,  141, np.dtype('<u2')),  # HSC170X (old)
+    44315200:  (640,  480,  141, np.uint8),         # HSC170X (new)
+    585755200: (1920, 1080, 141, np.dtype('<u2')),  # HSC180X_CL
+    14805000:  (350,  300,  141, np.uint8),         # custom format
+}
+
+
+def _read(buffer, file_size):
+    """
+    Decodes one cube using the format parameters for its file size.
+
+    Parameters:
+    -----------
+    buffer : bytes-like
+        Binary content containing header and data.
+    file_size : int
+        Total size of the buffer in bytes; must be a key of _FORMATS.
+
+    Returns:
+    --------
+    np.ndarray
+        Hyperspectral data with shape (Z, Y, X).
+    int
+        Y dimension.
+    int
+        X dimension.
+    """
+    X, Y, Z, dtype = _FORMATS[file_size]
+    RAW_len = X * Y * Z * np.dtype(dtype).itemsize
+    header_size = file_size - RAW_len
+    dat = np.frombuffer(buffer, dtype=dtype, count=Y * Z * X, offset=header_size)
+    HSData = np.reshape(dat, (Y, Z, X)).swapaxes(0, 1)
+    return HSData, Y, X
+
+
+def load_hsd_local(file_obj):
+    """
+    Loads a hyperspectral .hsd or .dat file from a file-like object into a numpy array.
+
+    Parameters:
+    -----------
+    file_obj : file-like object
+        File-like object returned by Streamlit's st.file_uploader.
+
+    Returns:
+    --------
+    np.ndarray
+        Hyperspectral data array viewed band-major with shape (Z, Y, X). The
+        array is a zero-copy view over an mmap'd temp file (kept alive through
+        the array's base reference), so the cube is never fully materialized
+        in RAM.
+    int
+        Y dimension (height).
+    int
+        X dimension (width).
+    """
+    # Spill the upload to a temp file in 8 MB chunks instead of read()-ing it
+    # whole, then mmap the file so numpy can view it straight off the page cache.
+    with tempfile.TemporaryFile() as tmp:
+        shutil.copyfileobj(file_obj, tmp, length=8 * 1024 * 1024)
+        tmp.flush()
+        mm = mmap.mmap(tmp.fileno(), 0, access=mmap.ACCESS_READ)
+        # A short read while spilling would otherwise surface later as an
+        # "unsupported file size" from the dispatch table; check against the
+        # size the upload declares (when it declares one) and say so directly.
+        declared_size = getattr(file_obj, "size", None)
+        if declared_size is not None and mm.size() != declared_size:
+            raise ValueError(
+                f"Short read spilling upload: got {mm.size()} of "
+                f"{declared_size} bytes"
+            )
+        # Hint the kernel to read the mapping ahead sequentially: the first
+        # band display otherwise stalls on 4 KB demand-paged faults. madvise
+        # and the MADV_* constants are only available on POSIX platforms.
+        if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+            mm.madvise(mmap.MADV_WILLNEED)
+    HSData, Y, X = read_HSD_from_buffer(mm)
+    return HSData, Y, X
+
+import os
+
+import numexpr as ne
+import streamlit as st
+from matplotlib import cm
+
+# numexpr splits each evaluate call into tiles and runs them on its own thread
+# pool; size it to the machine (capped at 8, past which large-band work is
+# DRAM-bandwidth-bound) so normalizing a 1080p band uses all cores. The NDVI
+# kernels parallelize separately via numba's prange.
+ne.set_num_threads(min(8, os.cpu_count() or 1))
+
+# viridis as a plain 256-entry RGBA byte LUT; applying it by fancy indexing
+# replaces the whole Figure/Agg/PNG render pipeline for static heatmaps.
+_VIRIDIS_LUT = (cm.viridis(np.linspace(0.0, 1.0, 256)) * 255).astype(np.uint8)
+
+
+def display_heatmap(image_band, title="Band", vmin=None, vmax=None):
+    """
+    Display a single 2D image band as a heatmap in Streamlit.
+
+    The band is normalized to uint8, colored through a viridis LUT and shown
+    with st.image, so no matplotlib figure is built per call.
+
+    Parameters:
+        image_band (numpy.ndarray): 2D array representing a single spectral band.
+        title (str): Caption for the heatmap. Default is "Band".
+        vmin, vmax (float, optional): Fixed color range; pass 0/255 for
+            quantized uint8 NDVI so the scale stays stable across reruns.
+            Defaults to the band's min/max.
+
+    Returns:
+        None
+    """
+    band = np.asarray(image_band)
+    lo = float(band.min()) if vmin is None else float(vmin)
+    hi = float(band.max()) if vmax is None else float(vmax)
+    if band.dtype == np.uint8 and lo == 0.0 and hi == 255.0:
+        q = band  # already LUT-ready (quantized NDVI path)
+    else:
+        scale = 255.0 / (hi - lo) if hi > lo else 0.0
+        t = ne.evaluate("(band - lo) * scale")
+        q = np.clip(t, 0, 255, out=t).astype(np.uint8)
+    st.image(_VIRIDIS_LUT[q], caption=title)
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _ndvi_kernel(nir, red, out):
+    eps = np.float32(1e-6)
+    for i in prange(out.size):
+        n = np.float32(nir[i])
+        r = np.float32(red[i])
+        out[i] = (n - r) / (n + r + eps)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _ndvi_quantize_kernel(nir, red, out):
+    eps = np.float32(1e-6)
+    for i in prange(out.size):
+        n = np.float32(nir[i])
+        r = np.float32(red[i])
+        out[i] = np.uint8((((n - r) / (n + r + eps)) + np.float32(1.0)) * np.float32(127.5))
+
+
+def calculate_ndvi(hsi_cube, nir_band_idx, red_band_idx, quantize=True):
+    """
+    Calculate the Normalized Difference Vegetation Index (NDVI) from a hyperspectral cube.
+
+    NDVI = (NIR - Red) / (NIR + Red)
+
+    Parameters:
+        hsi_cube (numpy.ndarray): 3D hyperspectral image cube in BSQ layout (bands x rows x cols).
+        nir_band_idx (int): Index of the Near-Infrared (NIR) band.
+        red_band_idx (int): Index of the Red band.
+        quantize (bool): If True (default), map [-1, 1] onto uint8 [0, 255] for
+            the display path; a byte per pixel is enough for a 256-color LUT.
+            If False, return the raw float32 NDVI.
+
+    Returns:
+        numpy.ndarray: 2D NDVI image — uint8 in [0, 255] when quantized,
+        otherwise float32 in [-1, 1].
+    """
+    band_shape = hsi_cube.shape[1:]
+    # Band slices of the BIL-backed cube are strided (Y row-runs of X), so
+    # gather each one into a flat contiguous slab first; the jitted kernels
+    # then run one parallel SIMD pass — cast, subtract, add, divide (and
+    # quantization) fused into a single loop.
+    nir = np.ascontiguousarray(hsi_cube[nir_band_idx]).ravel()
+    red = np.ascontiguousarray(hsi_cube[red_band_idx]).ravel()
+    if quantize:
+        ndvi = np.empty(nir.size, dtype=np.uint8)
+        _ndvi_quantize_kernel(nir, red, ndvi)
+    else:
+        ndvi = np.empty(nir.size, dtype=np.float32)
+        _ndvi_kernel(nir, red, ndvi)
+    return ndvi.reshape(band_shape)
+
+import numpy as np
+
+def get_red_nir_band_indices(
+    wavelengths: np.ndarray,
+    red_target: float = 660.0,
+    nir_target: float = 800.0
+) -> tuple[int, int]:
+    """
+    Returns the indices of the Red and NIR bands based on the nearest wavelengths.
+
+    Parameters:
+    -----------
+    wavelengths : np.ndarray
+        1D array of wavelengths (in nanometers), one per band.
+    red_target : float
+        Target wavelength for the Red band (default is 660 nm).
+    nir_target : float
+        Target wavelength for the NIR band (default is 800 nm).
+
+    Returns:
+    --------
+    red_idx : int
+        Index of the closest band to the red_target.
+    nir_idx : int
+        Index of the closest band to the nir_target.
+    """
+    red_idx = int(np.argmin(np.abs(wavelengths - red_target)))
+    nir_idx = int(np.argmin(np.abs(wavelengths - nir_target)))
+
+    if red_idx >= len(wavelengths) or nir_idx >= len(wavelengths):
+        raise IndexError("Red or NIR index is out of bounds.")
+
+    return red_idx, nir_idx
+
+
+
+def generate_wavelengths(num_bands: int, start_nm: float, step_nm: float) -> np.ndarray:
+    """
+    Generate wavelengths given start, step and number of bands.
+    """
+    return np.array([start_nm + i * step_nm for i in range(num_bands)])
+
+